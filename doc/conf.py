@@ -5,7 +5,7 @@
 
 import time
 
-from importlib.metadata import distribution
+from gridtk._version import __version__
 
 # -- General configuration -----------------------------------------------------
 
@@ -21,12 +21,11 @@ extensions = [
 
 # General information about the project.
 project = "gridtk"
-package = distribution(project)
 
 copyright = f"{time.strftime('%Y')}, Idiap Research Institute"  # noqa: A001
 
 # The short X.Y version.
-version = package.version
+version = __version__
 # The full version, including alpha/beta/rc tags.
 release = version
 
@@ -36,7 +35,6 @@ pygments_dark_style = "monokai"
 
 # Some variables which are useful for generated material
 project_variable = project.replace(".", "_")
-short_description = package.metadata["Summary"]
 owner = ["Idiap Research Institute"]
 
 # -- Options for HTML output ---------------------------------------------------
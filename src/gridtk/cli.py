@@ -3,31 +3,43 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import pydoc
-import tempfile
+import itertools
 
-from collections import defaultdict
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import click
 
+from .tools import JOB_STATES, JOB_STATES_MAPPING
+
+if TYPE_CHECKING:
+    from .manager import JobManager
+
+STATES_HELP = (
+    "Selects jobs based on their states separated by comma. Possible values are "
+    + ", ".join([f"{v} ({k})" for k, v in JOB_STATES_MAPPING.items()])
+    + " and ALL."
+)
+VALID_STATES = " ".join([*JOB_STATES_MAPPING.keys(), *JOB_STATES_MAPPING.values()])
+
 
 class CustomGroup(click.Group):
     """Custom command group that does not sort commands."""
 
+    aliases = {
+        "sbatch": "submit",
+        "ls": "list",
+        "rm": "delete",
+        "remove": "delete",
+    }
+
     def list_commands(self, ctx: click.Context) -> list[str]:
         # do not sort the commands
         return self.commands
 
     def get_command(self, ctx, cmd_name):
         """get_command with prefix aliasing and name aliases."""
-        cmd_name = {
-            "sbatch": "submit",
-            "ls": "list",
-            "rm": "delete",
-            "remove": "delete",
-        }.get(cmd_name, cmd_name)
+        cmd_name = self.aliases.get(cmd_name, cmd_name)
         rv = click.Group.get_command(self, ctx, cmd_name)
         if rv is not None:
             return rv
@@ -45,28 +57,24 @@ def parse_job_ids(job_ids: str) -> list[int]:
     """Parse the job ids."""
     if not job_ids:
         return []
-    try:
-        if "," in job_ids:
-            final_job_ids = []
-            for job_id in job_ids.split(","):
-                final_job_ids.extend(parse_job_ids(job_id))
-            return final_job_ids
-        if "-" in job_ids:
-            start, end_str = job_ids.split("-")
-            return list(range(int(start), int(end_str) + 1))
-        if "+" in job_ids:
-            start, length = job_ids.split("+")
-            end = int(start) + int(length)
-            return list(range(int(start), end + 1))
-        return [int(job_ids)]
-    except ValueError as e:
-        raise click.BadParameter(f"Invalid job id {job_ids}") from e
+    final_job_ids: list[int] = []
+    for job_id in job_ids.split(","):
+        try:
+            if "-" in job_id:
+                start, end = job_id.split("-")
+                final_job_ids.extend(range(int(start), int(end) + 1))
+            elif "+" in job_id:
+                start, length = job_id.split("+")
+                final_job_ids.extend(range(int(start), int(start) + int(length) + 1))
+            else:
+                final_job_ids.append(int(job_id))
+        except ValueError as e:
+            raise click.BadParameter(f"Invalid job id {job_id}") from e
+    return final_job_ids
 
 
 def parse_states(states: str) -> list[str]:
     """Normalize a list of comma-separated states to their long name format."""
-    from .models import JOB_STATES_MAPPING
-
     if not states:
         return []
     states = states.upper()
@@ -75,9 +83,9 @@ def parse_states(states: str) -> list[str]:
     final_states = []
     for state in states.split(","):
         state = JOB_STATES_MAPPING.get(state, state)
-        if state not in JOB_STATES_MAPPING.values():
+        if state not in JOB_STATES:
             raise click.BadParameter(
-                f"Invalid state: {state}\nValid values are: ALL {' '.join(list(JOB_STATES_MAPPING.keys())+list(JOB_STATES_MAPPING.values()))} or a comma (,) separated list of them."
+                f"Invalid state: {state}\nValid values are: ALL {VALID_STATES} or a comma (,) separated list of them."
             )
         final_states.append(state)
     return final_states
@@ -85,18 +93,17 @@ def parse_states(states: str) -> list[str]:
 
 def job_ids_callback(ctx, param, value):
     """Implement a callback for the job ids option."""
-    return parse_job_ids(value)
+    return parse_job_ids(value) if value else []
 
 
 def states_callback(ctx, param, value):
     """Implement a callback for the states option."""
-    return parse_states(value)
+    return parse_states(value) if value else []
 
 
 def job_filters(f_py=None, default_states=None):
     """Filter jobs based on the provided function and default states."""
     assert callable(f_py) or f_py is None
-    from .models import JOB_STATES_MAPPING
 
     def _job_filters_decorator(function):
         function = click.option(
@@ -110,9 +117,7 @@ def job_filters(f_py=None, default_states=None):
             "--state",
             "states",
             default=default_states,
-            help="Selects jobs based on their states separated by comma. Possible values are "
-            + ", ".join([f"{v} ({k})" for k, v in JOB_STATES_MAPPING.items()])
-            + " and ALL.",
+            help=STATES_HELP,
             callback=states_callback,
         )(function)
         function = click.option(
@@ -137,6 +142,123 @@ def job_filters(f_py=None, default_states=None):
     return _job_filters_decorator(f_py) if callable(f_py) else _job_filters_decorator
 
 
+# sbatch options that are passed through to sbatch as is. They are hidden from
+# the help message of gridtk submit; see sbatch --help instead.
+_SBATCH_OPTIONS: tuple[tuple[tuple[str, ...], dict[str, bool]], ...] = (
+    (("-A", "--account"), {}),
+    (("--acctg-freq",), {}),
+    (("--batch",), {}),
+    (("--bb",), {}),
+    (("--bbf",), {}),
+    (("-b", "--begin"), {}),
+    (("-D", "--chdir"), {}),
+    (("--cluster-constraint",), {}),
+    (("-M", "--clusters"), {}),
+    (("--comment",), {}),
+    (("-C", "--constraint"), {}),
+    (("--container",), {}),
+    (("--container-id",), {}),
+    (("--contiguous",), {"is_flag": True}),
+    (("-S", "--core-spec"), {}),
+    (("--cores-per-socket",), {}),
+    (("--cpu-freq",), {}),
+    (("--cpus-per-gpu",), {}),
+    (("-c", "--cpus-per-task"), {}),
+    (("--deadline",), {}),
+    (("--delay-boot",), {}),
+    (("-m", "--distribution"), {}),
+    (("-e", "--error"), {}),
+    (("-x", "--exclude"), {}),
+    (("--exclusive",), {}),
+    (("--export",), {}),
+    (("--export-file",), {}),
+    (("--extra",), {}),
+    (("-B", "--extra-node-info"), {}),
+    (("--get-user-env",), {}),
+    (("--gid",), {}),
+    (("--gpu-bind",), {}),
+    (("--gpu-freq",), {}),
+    (("-G", "--gpus"), {}),
+    (("--gpus-per-node",), {}),
+    (("--gpus-per-socket",), {}),
+    (("--gpus-per-task",), {}),
+    (("--gres",), {}),
+    (("--gres-flags",), {}),
+    (("--hint",), {}),
+    (("-H", "--hold"), {"is_flag": True}),
+    (("--ignore-pbs",), {"is_flag": True}),
+    (("-i", "--input"), {}),
+    (("--kill-on-invalid-dep",), {}),
+    (("-L", "--licenses"), {}),
+    (("--mail-type",), {}),
+    (("--mail-user",), {}),
+    (("--mcs-label",), {}),
+    (("--mem",), {}),
+    (("--mem-bind",), {}),
+    (("--mem-per-cpu",), {}),
+    (("--mem-per-gpu",), {}),
+    (("--mincpus",), {}),
+    (("--network",), {}),
+    (("--nice",), {}),
+    (("-k", "--no-kill"), {"is_flag": True}),
+    (("--no-requeue",), {"is_flag": True}),
+    (("-F", "--nodefile"), {}),
+    (("-w", "--nodelist"), {}),
+    (("-N", "--nodes"), {}),
+    (("-n", "--ntasks"), {}),
+    (("--ntasks-per-core",), {}),
+    (("--ntasks-per-gpu",), {}),
+    (("--ntasks-per-node",), {}),
+    (("--ntasks-per-socket",), {}),
+    (("--open-mode",), {}),
+    (("-o", "--output"), {}),
+    (("-O", "--overcommit"), {"is_flag": True}),
+    (("-s", "--oversubscribe"), {"is_flag": True}),
+    (("--parsable",), {"is_flag": True}),
+    (("-p", "--partition"), {}),
+    (("--prefer",), {}),
+    (("--priority",), {}),
+    (("--profile",), {}),
+    (("--propagate",), {}),
+    (("-q", "--qos"), {}),
+    (("-Q", "--quiet"), {"is_flag": True}),
+    (("--reboot",), {"is_flag": True}),
+    (("--requeue",), {"is_flag": True}),
+    (("--reservation",), {}),
+    (("--resv-ports",), {}),
+    (("--segment",), {}),
+    (("--signal",), {}),
+    (("--sockets-per-node",), {}),
+    (("--spread-job",), {"is_flag": True}),
+    (("--stepmgr",), {"is_flag": True}),
+    (("--switches",), {}),
+    (("--test-only",), {"is_flag": True}),
+    (("--thread-spec",), {}),
+    (("--threads-per-core",), {}),
+    (("-t", "--time"), {}),
+    (("--time-min",), {}),
+    (("--tmp",), {}),
+    (("--tres-bind",), {}),
+    (("--tres-per-task",), {}),
+    (("--uid",), {}),
+    (("--usage",), {"is_flag": True}),
+    (("--use-min-nodes",), {"is_flag": True}),
+    (("-v", "--verbose"), {"is_flag": True, "multiple": True}),
+    (("-V", "--version"), {"is_flag": True}),
+    (("-W", "--wait"), {"is_flag": True}),
+    (("--wait-all-nodes",), {}),
+    (("--wckey",), {}),
+    (("--wrap",), {}),
+)
+
+
+def sbatch_options(function):
+    """Add the hidden sbatch options to the submit command."""
+    for param_decls, attrs in reversed(_SBATCH_OPTIONS):
+        function = click.option(*param_decls, hidden=True, **attrs)(function)
+    return function
+
+
 @click.group(
     cls=CustomGroup,
     context_settings={
@@ -208,111 +330,7 @@ gridtk submit --- python my_code.py
     type=click.INT,
     help="Submits the job N times. Each job will depend on the job before.",
 )
-# sbatch options
-@click.option("-A", "--account", hidden=True)
-@click.option("--acctg-freq", hidden=True)
-@click.option("--batch", hidden=True)
-@click.option("--bb", hidden=True)
-@click.option("--bbf", hidden=True)
-@click.option("-b", "--begin", hidden=True)
-@click.option("-D", "--chdir", hidden=True)
-@click.option("--cluster-constraint", hidden=True)
-@click.option("-M", "--clusters", hidden=True)
-@click.option("--comment", hidden=True)
-@click.option("-C", "--constraint", hidden=True)
-@click.option("--container", hidden=True)
-@click.option("--container-id", hidden=True)
-@click.option("--contiguous", is_flag=True, hidden=True)
-@click.option("-S", "--core-spec", hidden=True)
-@click.option("--cores-per-socket", hidden=True)
-@click.option("--cpu-freq", hidden=True)
-@click.option("--cpus-per-gpu", hidden=True)
-@click.option("-c", "--cpus-per-task", hidden=True)
-@click.option("--deadline", hidden=True)
-@click.option("--delay-boot", hidden=True)
-@click.option("-m", "--distribution", hidden=True)
-@click.option("-e", "--error", hidden=True)
-@click.option("-x", "--exclude", hidden=True)
-@click.option("--exclusive", hidden=True)
-@click.option("--export", hidden=True)
-@click.option("--export-file", hidden=True)
-@click.option("--extra", hidden=True)
-@click.option("-B", "--extra-node-info", hidden=True)
-@click.option("--get-user-env", hidden=True)
-@click.option("--gid", hidden=True)
-@click.option("--gpu-bind", hidden=True)
-@click.option("--gpu-freq", hidden=True)
-@click.option("-G", "--gpus", hidden=True)
-@click.option("--gpus-per-node", hidden=True)
-@click.option("--gpus-per-socket", hidden=True)
-@click.option("--gpus-per-task", hidden=True)
-@click.option("--gres", hidden=True)
-@click.option("--gres-flags", hidden=True)
-@click.option("--hint", hidden=True)
-@click.option("-H", "--hold", is_flag=True, hidden=True)
-@click.option("--ignore-pbs", is_flag=True, hidden=True)
-@click.option("-i", "--input", hidden=True)
-@click.option("--kill-on-invalid-dep", hidden=True)
-@click.option("-L", "--licenses", hidden=True)
-@click.option("--mail-type", hidden=True)
-@click.option("--mail-user", hidden=True)
-@click.option("--mcs-label", hidden=True)
-@click.option("--mem", hidden=True)
-@click.option("--mem-bind", hidden=True)
-@click.option("--mem-per-cpu", hidden=True)
-@click.option("--mem-per-gpu", hidden=True)
-@click.option("--mincpus", hidden=True)
-@click.option("--network", hidden=True)
-@click.option("--nice", hidden=True)
-@click.option("-k", "--no-kill", is_flag=True, hidden=True)
-@click.option("--no-requeue", is_flag=True, hidden=True)
-@click.option("-F", "--nodefile", hidden=True)
-@click.option("-w", "--nodelist", hidden=True)
-@click.option("-N", "--nodes", hidden=True)
-@click.option("-n", "--ntasks", hidden=True)
-@click.option("--ntasks-per-core", hidden=True)
-@click.option("--ntasks-per-gpu", hidden=True)
-@click.option("--ntasks-per-node", hidden=True)
-@click.option("--ntasks-per-socket", hidden=True)
-@click.option("--open-mode", hidden=True)
-@click.option("-o", "--output", hidden=True)
-@click.option("-O", "--overcommit", is_flag=True, hidden=True)
-@click.option("-s", "--oversubscribe", is_flag=True, hidden=True)
-@click.option("--parsable", is_flag=True, hidden=True)
-@click.option("-p", "--partition", hidden=True)
-@click.option("--prefer", hidden=True)
-@click.option("--priority", hidden=True)
-@click.option("--profile", hidden=True)
-@click.option("--propagate", hidden=True)
-@click.option("-q", "--qos", hidden=True)
-@click.option("-Q", "--quiet", is_flag=True, hidden=True)
-@click.option("--reboot", is_flag=True, hidden=True)
-@click.option("--requeue", is_flag=True, hidden=True)
-@click.option("--reservation", hidden=True)
-@click.option("--resv-ports", hidden=True)
-@click.option("--segment", hidden=True)
-@click.option("--signal", hidden=True)
-@click.option("--sockets-per-node", hidden=True)
-@click.option("--spread-job", is_flag=True, hidden=True)
-@click.option("--stepmgr", is_flag=True, hidden=True)
-@click.option("--switches", hidden=True)
-@click.option("--test-only", is_flag=True, hidden=True)
-@click.option("--thread-spec", hidden=True)
-@click.option("--threads-per-core", hidden=True)
-@click.option("-t", "--time", hidden=True)
-@click.option("--time-min", hidden=True)
-@click.option("--tmp", hidden=True)
-@click.option("--tres-bind", hidden=True)
-@click.option("--tres-per-task", hidden=True)
-@click.option("--uid", hidden=True)
-@click.option("--usage", is_flag=True, hidden=True)
-@click.option("--use-min-nodes", is_flag=True, hidden=True)
-@click.option("-v", "--verbose", is_flag=True, multiple=True, hidden=True)
-@click.option("-V", "--version", is_flag=True, hidden=True)
-@click.option("-W", "--wait", is_flag=True, hidden=True)
-@click.option("--wait-all-nodes", hidden=True)
-@click.option("--wckey", hidden=True)
-@click.option("--wrap", hidden=True)
+@sbatch_options
 @click.argument("script", nargs=-1, type=click.UNPROCESSED)
 @click.pass_context
 def submit(
@@ -325,25 +343,25 @@ def submit(
     **kwargs,
 ):
     """Submit a job to the queue."""
-    from .manager import JobManager
-
     job_manager: JobManager = ctx.meta["job_manager"]
-    # reconstruct the command with kwargs and script
-    command = []
-    for k, v in kwargs.items():
-        if v in (None, False):
-            # option was not provided
-            continue
-        if k in ("output", "error"):
-            # we ignore output and error options
-            continue
-        k = k.replace("_", "-")
-        if isinstance(v, str):
-            command.extend([f"--{k}", f"{v}"])
-        elif isinstance(v, bool):
-            command.append(f"--{k}")
-
-    command.extend(script)
+
+    def option_args(name: str, value) -> tuple[str, ...]:
+        flag = f"--{name.replace('_', '-')}"
+        if isinstance(value, str):
+            return (flag, value)
+        # repeated flags such as -vv are given as a tuple
+        return (flag,) * (len(value) if isinstance(value, tuple) else 1)
+
+    # reconstruct the command with kwargs and script. Options that were not
+    # provided are None, False or () and we ignore output and error options
+    command = [
+        *itertools.chain.from_iterable(
+            option_args(k, v)
+            for k, v in kwargs.items()
+            if v not in (None, False, ()) and k not in ("output", "error")
+        ),
+        *script,
+    ]
 
     with job_manager as session:
         if repeat > 1:
@@ -353,17 +371,15 @@ def submit(
                 raise click.UsageError(
                     f"Repeated jobs can only have one dependency type (no `,` or `?` in --dependency) but got {dependencies}"
                 )
-        for _ in range(repeat):
-            job = job_manager.submit_job(
-                name=job_name,
-                command=command,
-                array=array,
-                dependencies=dependencies,
-            )
+        jobs = job_manager.submit_jobs_chain(
+            name=job_name,
+            command=command,
+            array=array,
+            dependencies=dependencies,
+            count=repeat,
+        )
+        for job in jobs:
             click.echo(job.id)
-            deps = (dependencies or "").split(",")
-            deps[-1] = f"{deps[-1]}:{job.id}" if deps[-1] else str(job.id)
-            dependencies = ",".join(deps)
         session.commit()
 
 
@@ -378,8 +394,6 @@ def resubmit(
     dependents: bool,
 ):
     """Resubmit a job to the queue."""
-    from .manager import JobManager
-
     job_manager: JobManager = ctx.meta["job_manager"]
     with job_manager as session:
         jobs = job_manager.resubmit_jobs(
@@ -392,6 +406,11 @@ def resubmit(
 
 @cli.command(name="list")
 @job_filters
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="Also update finished jobs, e.g. after they were requeued with scontrol requeue.",
+)
 @click.pass_context
 def list_jobs(
     ctx: click.Context,
@@ -399,36 +418,60 @@ def list_jobs(
     states: list[str],
     names: list[str],
     dependents: bool,
+    refresh: bool,
 ):
     """List jobs in the queue, similar to sacct and squeue."""
     from tabulate import tabulate
 
-    from .manager import JobManager
-
     job_manager: JobManager = ctx.meta["job_manager"]
     with job_manager as session:
         jobs = job_manager.list_jobs(
-            job_ids=job_ids, states=states, names=names, dependents=dependents
+            job_ids=job_ids,
+            states=states,
+            names=names,
+            dependents=dependents,
+            refresh=refresh,
         )
-        table = defaultdict(list)
+        cwd = Path.cwd().resolve()
+        # log files are named after the job inside its logs directory so only
+        # the (few) distinct logs directories need to be resolved
+        resolved_logs_dirs = {
+            job_manager.logs_dir.absolute(): job_manager.logs_dir_resolved
+        }
+        rows = []
         for job in jobs:
-            table["job-id"].append(job.id)
-            table["slurm-id"].append(job.grid_id)
-            table["nodes"].append(job.nodes)
-            table["state"].append(f"{job.state} ({job.exit_code})")
-            table["job-name"].append(job.name)
-            output = job.output_files[0].resolve()
+            if job.logs_dir not in resolved_logs_dirs:
+                resolved_logs_dirs[job.logs_dir] = job.logs_dir.resolve()
+            # only the first output file is shown, no need to build all of them
+            output_name = next(job.iter_output_files()).name
+            output = resolved_logs_dirs[job.logs_dir] / output_name
             try:
-                output = output.relative_to(Path.cwd().resolve())
+                output = output.relative_to(cwd)
             except ValueError:
                 pass
-
-            table["output"].append(output)
-            table["dependencies"].append(
-                ",".join([str(dep_job) for dep_job in job.dependencies_ids])
+            rows.append(
+                (
+                    job.id,
+                    job.grid_id,
+                    job.nodes,
+                    f"{job.state} ({job.exit_code})",
+                    job.name,
+                    output,
+                    ",".join([str(dep_job) for dep_job in job.dependencies_ids]),
+                    job.command_str,
+                )
             )
-            table["command"].append("gridtk submit " + " ".join(job.command))
-        click.echo(tabulate(table, headers="keys"))
+        headers = [
+            "job-id",
+            "slurm-id",
+            "nodes",
+            "state",
+            "job-name",
+            "output",
+            "dependencies",
+            "command",
+        ]
+        click.echo(tabulate(rows, headers=headers))
         session.commit()
 
 
@@ -443,8 +486,6 @@ def stop(
     dependents: bool,
 ):
     """Stop a job from running."""
-    from .manager import JobManager
-
     job_manager: JobManager = ctx.meta["job_manager"]
     with job_manager as session:
         jobs = job_manager.stop_jobs(
@@ -466,8 +507,6 @@ def delete(
     dependents: bool,
 ):
     """Delete a job from the queue."""
-    from .manager import JobManager
-
     job_manager: JobManager = ctx.meta["job_manager"]
     with job_manager as session:
         jobs = job_manager.delete_jobs(
@@ -496,7 +535,57 @@ def report(
     array_idx: Optional[str],
 ):
     """Report on jobs in the queue."""
-    from .manager import JobManager
+    import tempfile
+
+    def read_log(path: Path, chunk_size: int = 64 * 1024):
+        # stream log files instead of loading them in memory at once. Logs of
+        # array tasks that did not run yet do not exist and are skipped.
+        try:
+            f = path.open()
+        except FileNotFoundError:
+            return
+        with f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+        yield "\n\n"
+
+    def job_report(job, session):
+        yield f"Job ID: {job.id}\n"
+        yield f"Name: {job.name}\n"
+        yield f"State: {job.state} ({job.exit_code})\n"
+        yield f"Nodes: {job.nodes}\n"
+        if not job.command_in_bash:
+            yield f"Submitted command: {job.submitted_command(None, session=session)}\n"
+        else:
+            with tempfile.NamedTemporaryFile(mode="w+t", suffix=".sh") as tmpfile:
+                yield f"Submitted command: {job.submitted_command(tmpfile, session=session)}\n"
+                yield f"Content of the temporary script:\n{job.command_in_bash}\n"
+        if array_idx is None:
+            output_files, error_files = job.output_files, job.error_files
+        else:
+            # only build the log paths of the requested array task
+            array_task_id = int(array_idx)
+            if array_task_id not in job.array_task_ids:
+                raise ValueError(f"{array_task_id} is not in {job.array_task_ids}")
+            output_files = job.iter_output_files([array_task_id])
+            error_files = job.iter_error_files([array_task_id])
+        for output, error in zip(output_files, error_files):
+            yield f"Output file: {output}\n"
+            yield from read_log(output)
+            if error != output:
+                yield f"Error file: {error}\n"
+                yield from read_log(error)
+
+    def without_final_newline(chunks):
+        # click.echo_via_pager adds a newline after the text, which the report
+        # already ends with
+        previous = None
+        for chunk in chunks:
+            if previous is not None:
+                yield previous
+            previous = chunk
+        if previous is not None:
+            yield previous[:-1] if previous.endswith("\n") else previous
 
     job_manager: JobManager = ctx.meta["job_manager"]
     with job_manager as session:
@@ -504,31 +593,7 @@ def report(
             job_ids=job_ids, states=states, names=names, dependents=dependents
         )
         for job in jobs:
-            report_text = ""
-            report_text += f"Job ID: {job.id}\n"
-            report_text += f"Name: {job.name}\n"
-            report_text += f"State: {job.state} ({job.exit_code})\n"
-            report_text += f"Nodes: {job.nodes}\n"
-            with tempfile.NamedTemporaryFile(mode="w+t", suffix=".sh") as tmpfile:
-                report_text += f"Submitted command: {job.submitted_command(tmpfile, session=session)}\n"
-                if job.command_in_bash:
-                    report_text += (
-                        f"Content of the temporary script:\n{job.command_in_bash}\n"
-                    )
-            output_files, error_files = job.output_files, job.error_files
-            if array_idx is not None:
-                real_array_idx = job.array_task_ids.index(int(array_idx))
-                output_files = output_files[real_array_idx : real_array_idx + 1]
-                error_files = error_files[real_array_idx : real_array_idx + 1]
-            for output, error in zip(output_files, error_files):
-                report_text += f"Output file: {output}\n"
-                if output.exists():
-                    report_text += output.open().read() + "\n\n"
-                if error != output:
-                    report_text += f"Error file: {error}\n"
-                    if error.exists():
-                        report_text += error.open().read() + "\n\n"
-            pydoc.pager(report_text)
+            click.echo_via_pager(without_final_newline(job_report(job, session)))
         session.commit()
 
 
@@ -18,6 +18,7 @@ Useful commands:
         sacctmgr show qos format=Name%20,Priority,Flags%30,MaxWall,MaxTRESPU%20,MaxJobsPU,MaxSubmitPU,MaxTRESPA%25
 """
 
+import functools
 import json
 import os
 import shutil
@@ -29,11 +30,11 @@ from typing import Any, Optional
 
 import sqlalchemy
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, create_engine, or_, select
+from sqlalchemy.orm import Session, selectinload
 
-from .models import Base, Job, JobDependency
-from .tools import job_ids_from_dep_str, parse_array_indexes
+from .models import Base, Job, JobDependency, job_dependencies
+from .tools import JOB_FINAL_STATES, job_ids_from_dep_str, parse_array_indexes
 
 
 def parse_scontrol_output(output: str) -> dict[str, Any]:
@@ -67,32 +68,59 @@ def job_status_from_scontrol(job_id: int) -> dict:
     return parse_scontrol_output(output)
 
 
+SACCT_MAX_JOB_IDS = 500
+"""Maximum number of job ids passed to a single sacct call."""
+
+
 def update_job_statuses(grid_ids: Iterable[int]) -> dict[int, dict]:
     """Retrieve the status of the jobs in the database."""
+    grid_ids = list(grid_ids)
     status = dict()
-    try:
-        output = subprocess.check_output(
-            ["sacct", "-j", ",".join([str(x) for x in grid_ids]), "--json"],
-            text=True,
-        )
-    except subprocess.CalledProcessError:
-        for job_id in grid_ids:
-            job_status = job_status_from_scontrol(job_id)
-            if job_status:
-                status[job_id] = job_status
-        return status
-    for job in json.loads(output)["jobs"]:
-        status[job["job_id"]] = job
+    # query sacct in chunks to stay below the command line length limits
+    for start in range(0, len(grid_ids), SACCT_MAX_JOB_IDS):
+        chunk = grid_ids[start : start + SACCT_MAX_JOB_IDS]
+        try:
+            output = subprocess.check_output(
+                ["sacct", "-j", ",".join([str(x) for x in chunk]), "--json"],
+                text=True,
+            )
+        except subprocess.CalledProcessError:
+            for job_id in chunk:
+                job_status = job_status_from_scontrol(job_id)
+                if job_status:
+                    status[job_id] = job_status
+            continue
+        for job in json.loads(output)["jobs"]:
+            status[job["job_id"]] = job
     return status
 
 
-def get_dependent_jobs_recursive(jobs: Iterable[Job]) -> list[Job]:
-    """Get all the dependent jobs of a job recursively."""
-    dependent_jobs = set()
-    for job in jobs:
-        dependent_jobs.add(job)
-        dependent_jobs.update(get_dependent_jobs_recursive(job.dependents))
-    return list(sorted(dependent_jobs, key=lambda x: x.id))
+def cancel_jobs(jobs: Iterable[Job], delete_logs: bool = False) -> None:
+    """Cancel several jobs with a single scancel call."""
+    jobs = list(jobs)
+    # jobs without a grid id were never submitted and would make scancel fail
+    # for all the other jobs
+    grid_ids = [str(job.grid_id) for job in jobs if job.grid_id]
+    if grid_ids:
+        subprocess.check_output(["scancel"] + grid_ids)
+    if delete_logs:
+        for job in jobs:
+            job.delete_logs()
+
+
+def select_job_ids_with_dependents(*filters) -> Select:
+    """Select the ids of the matching jobs and of all the jobs that depend on
+    them, recursively.
+    """
+    # the dependency graph is walked by SQLite with a recursive CTE. UNION
+    # (and not UNION ALL) visits each job only once.
+    closure = select(Job.id).where(*filters).cte("closure", recursive=True)
+    closure = closure.union(
+        select(job_dependencies.c.job_id).where(
+            job_dependencies.c.waited_for_job_id == closure.c.id
+        )
+    )
+    return select(closure.c.id)
 
 
 class JobManager:
@@ -102,6 +130,10 @@ class JobManager:
         self, database: Path, logs_dir: Path, read_only: Optional[bool] = None
     ) -> None:
         self.database = Path(database)
+        self.logs_dir = Path(logs_dir)
+        # the database can only end up empty if it is created here or if jobs
+        # are deleted, otherwise there is nothing to clean up on exit
+        self._check_empty = not (self.database.exists() and self.logs_dir.exists())
         # check if database exists and is read-only
         if (
             read_only is None
@@ -111,15 +143,25 @@ class JobManager:
             read_only = True
         self.read_only = read_only
         self.engine = create_engine(f"sqlite:///{self.database}", echo=False)
-        self.logs_dir = Path(logs_dir)
         self.logs_dir.mkdir(exist_ok=True)
+        # the schema only needs to be checked once per manager
+        self._schema_checked = False
 
     def __enter__(self):
         # opens a new session and returns it
-        if not self.read_only:
-            Base.metadata.create_all(self.engine)
+        if not self.read_only and not self._schema_checked:
+            with self.engine.begin() as connection:
+                Base.metadata.create_all(connection)
+                # create_all skips the indexes of existing tables, e.g. of
+                # databases created before those indexes were declared
+                for table in Base.metadata.sorted_tables:
+                    for index in table.indexes:
+                        index.create(connection, checkfirst=True)
+            self._schema_checked = True
         self._session = Session(self.engine)
         self._session.begin()
+        # job statuses are polled from Slurm at most once per session
+        self._jobs_updated = False
         return self._session
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -133,11 +175,50 @@ class JobManager:
     def session(self) -> Session:
         return self._session
 
+    @functools.cached_property
+    def logs_dir_resolved(self) -> Path:
+        """The resolved logs directory, computed only when first needed."""
+        return self.logs_dir.resolve()
+
     def submit_job(self, name, command, array, dependencies):
+        return self.submit_jobs_chain(
+            name=name,
+            command=command,
+            array=array,
+            dependencies=dependencies,
+            count=1,
+        )[0]
+
+    def submit_jobs_chain(self, name, command, array, dependencies, count):
+        """Submit the same job ``count`` times, each depending on the one before.
+
+        The dependency relationships of all the jobs are inserted together
+        once every job is submitted.
+        """
+        # the array options are the same for all the jobs of the chain
         array_task_ids = None
         if array:
             command = ("--array", array) + tuple(command)
             array_task_ids = parse_array_indexes(array)
+        jobs = []
+        for _ in range(count):
+            jobs.append(
+                self._submit_job(name, command, array, array_task_ids, dependencies)
+            )
+            deps = (dependencies or "").split(",")
+            deps[-1] = f"{deps[-1]}:{jobs[-1].id}" if deps[-1] else str(jobs[-1].id)
+            dependencies = ",".join(deps)
+        rows = [
+            {"job_id": job.id, "waited_for_job_id": dep_id}
+            for job in jobs
+            # a job may appear several times, e.g. afterok:1,afterany:1
+            for dep_id in dict.fromkeys(job_ids_from_dep_str(job.dependencies_str))
+        ]
+        if rows:
+            self.session.execute(job_dependencies.insert(), rows)
+        return jobs
+
+    def _submit_job(self, name, command, array, array_task_ids, dependencies):
         job = Job(
             name=name,
             command=command,
@@ -150,20 +231,7 @@ class JobManager:
             job.submit(session=self.session)
             self.session.add(job)
             self.session.flush()
-            self.session.refresh(job)
-
-            if dependencies:
-                # add dependency relationships
-                dep_job_ids = job_ids_from_dep_str(dependencies)
-                self.session.add_all(
-                    [
-                        JobDependency(
-                            job_id=job.id,
-                            waited_for_job_id=dep_id,
-                        )
-                        for dep_id in dep_job_ids
-                    ]
-                )
+            self._jobs_updated = False
         except sqlalchemy.exc.SQLAlchemyError as e:
             raise RuntimeError(
                 f"""Failed to submit job with
@@ -174,12 +242,32 @@ dependencies: {dependencies}"""
             ) from e
         return job
 
-    def update_jobs(self) -> None:
-        """Update the status of all jobs."""
-        if self.read_only:
+    def update_jobs(self, job_ids=None, refresh=False) -> None:
+        """Update the status of all the jobs that have not finished yet.
+
+        If ``job_ids`` is given, only those jobs are updated. Otherwise Slurm
+        is only queried once per session unless new jobs are submitted in the
+        meantime. With ``refresh``, finished jobs are updated too, e.g. after
+        they were requeued with ``scontrol requeue``.
+        """
+        if self.read_only or (self._jobs_updated and not refresh):
             return
         jobs_by_grid_id: dict[int, Job] = dict()
         query = self.session.query(Job)
+        if not refresh:
+            # finished jobs do not change anymore. Array jobs are always polled
+            # because their state is the one of a single task.
+            query = query.filter(
+                or_(
+                    Job.is_array_job,
+                    Job.state.is_(None),
+                    Job.state.not_in(JOB_FINAL_STATES),
+                )
+            )
+        if job_ids:
+            query = query.filter(Job.id.in_(job_ids))
+        else:
+            self._jobs_updated = True
         for job in query.all():
             jobs_by_grid_id[job.grid_id] = job
         if not jobs_by_grid_id:
@@ -198,58 +286,73 @@ dependencies: {dependencies}"""
         names=None,
         update_jobs=True,
         dependents=False,
+        refresh=False,
     ) -> list[Job]:
         if update_jobs:
-            self.update_jobs()
-        jobs = []
-        query = self.session.query(Job)
+            # the dependents of the jobs are only known after the query
+            self.update_jobs(job_ids=None if dependents else job_ids, refresh=refresh)
+        # load the dependencies of all jobs with one extra query
+        query = self.session.query(Job).options(
+            selectinload(Job.dependencies_jobdependency)
+        )
+        filters = []
         if job_ids:
-            query = query.filter(Job.id.in_(job_ids))
+            filters.append(Job.id.in_(job_ids))
         if names:
-            query = query.filter(Job.name.in_(names))
+            filters.append(Job.name.in_(names))
         if states:
-            query = query.filter(Job.state.in_(states))
-        for job in query.all():
-            jobs.append(job)
+            filters.append(Job.state.in_(states))
         if dependents:
-            jobs = get_dependent_jobs_recursive(jobs)
-
-        return jobs
+            filters = [Job.id.in_(select_job_ids_with_dependents(*filters))]
+            query = query.order_by(Job.id)
+        return query.filter(*filters).all()
 
     def stop_jobs(self, delete=False, **kwargs):
         """Stop all jobs that match the given criteria."""
         jobs = self.list_jobs(**kwargs)
-        for job in jobs:
-            job.cancel(delete_logs=delete)
+        cancel_jobs(jobs, delete_logs=delete)
         if delete:
-            with self.session.no_autoflush:
-                for job in jobs:
-                    self.session.delete(job)
-                # also delete job dependencies
-                ids = [job.id for job in jobs]
-                self.session.query(JobDependency).filter(
-                    JobDependency.job_id.in_(ids)
-                    | JobDependency.waited_for_job_id.in_(ids)
-                ).delete()
+            ids = [job.id for job in jobs]
+            # delete the job dependencies first as they reference the jobs
+            self.session.query(JobDependency).filter(
+                JobDependency.job_id.in_(ids) | JobDependency.waited_for_job_id.in_(ids)
+            ).delete()
+            self.session.query(Job).filter(Job.id.in_(ids)).delete()
+            self._check_empty = True
         return jobs
 
     def delete_jobs(self, **kwargs):
+        # the job statuses are only needed when selecting jobs by state
+        kwargs.setdefault("update_jobs", bool(kwargs.get("states")))
         return self.stop_jobs(delete=True, **kwargs)
 
     def resubmit_jobs(self, **kwargs):
         jobs = self.list_jobs(**kwargs)
+        cancel_jobs(jobs, delete_logs=True)
+        # load the other jobs they depend on with one query instead of one
+        # query per submitted job. The session only keeps weak references to
+        # loaded jobs, so they are passed on explicitly.
+        loaded_jobs = {job.id: job for job in jobs}
+        dep_ids = {dep_id for job in jobs for dep_id in job.dependencies_ids}
+        dep_ids.difference_update(loaded_jobs)
+        if dep_ids:
+            for job in self.session.query(Job).filter(Job.id.in_(dep_ids)):
+                loaded_jobs[job.id] = job
         for job in jobs:
-            job.cancel(delete_logs=True)
-            job.submit(session=self.session)
+            job.submit(session=self.session, loaded_jobs=loaded_jobs)
             self.session.add(job)
+        self._jobs_updated = False
         return jobs
 
     def __del__(self):
         # if there are no jobs in the database, delete the database file and the logs directory (if empty)
+        if not self._check_empty:
+            self.engine.dispose()
+            return
         with self:
             if (
                 Path(self.database).exists()
-                and len(self.list_jobs(update_jobs=False)) == 0
+                and self.session.query(Job.id).first() is None
             ):
                 Path(self.database).unlink()
                 if self.logs_dir.exists() and len(os.listdir(self.logs_dir)) == 0:
@@ -3,6 +3,7 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import functools
 import json
 import re
 import shlex
@@ -14,7 +15,7 @@ from pathlib import Path
 from sqlite3 import Connection as SQLite3Connection
 from typing import Optional
 
-from sqlalchemy import Column, ForeignKey, Integer, String, Table, event
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Table, event
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import (
@@ -27,77 +28,71 @@ from sqlalchemy.orm import (
 )
 from sqlalchemy.types import TypeDecorator
 
-from .tools import job_ids_from_dep_str, replace_job_ids_in_dep_str
+from .tools import (
+    JOB_STATES,
+    JOB_STATES_MAPPING,  # noqa: F401 (re-exported, it used to live here)
+    job_ids_from_dep_str,
+    replace_job_ids_in_dep_str,
+)
+
+# the job id in the output of sbatch, e.g. "Submitted batch job 123456789"
+GRID_ID_PATTERN = re.compile(r"[0-9]+")
 
 
 # enable foreign key support in sqlite3
 # https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#foreign-key-support
+# WAL journaling is not enabled because it does not work on network file
+# systems (where job databases often live) nor with read-only databases.
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
-    """Enable foreign key support in sqlite3."""
+    """Enable foreign key support in sqlite3 and wait on locked databases."""
     if isinstance(dbapi_connection, SQLite3Connection):
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA foreign_keys=ON")
+        # wait for concurrent gridtk commands instead of failing with
+        # "database is locked"
+        cursor.execute("PRAGMA busy_timeout=30000")
         cursor.close()
 
 
-JOB_STATES_MAPPING = {
-    "BF": "BOOT_FAIL",
-    "CA": "CANCELLED",
-    "CD": "COMPLETED",
-    "CF": "CONFIGURING",
-    "CG": "COMPLETING",
-    "DL": "DEADLINE",
-    "F": "FAILED",
-    "NF": "NODE_FAIL",
-    "OOM": "OUT_OF_MEMORY",
-    "PD": "PENDING",
-    "PR": "PREEMPTED",
-    "RD": "RESV_DEL_HOLD",
-    "RF": "REQUEUE_FED",
-    "RH": "REQUEUE_HOLD",
-    "RQ": "REQUEUED",
-    "R": "RUNNING",
-    "RS": "RESIZING",
-    "RV": "REVOKED",
-    "SE": "SPECIAL_EXIT",
-    "SI": "SIGNALING",
-    "SO": "STAGE_OUT",
-    "S": "SUSPENDED",
-    "ST": "STOPPED",
-    "TO": "TIMEOUT",
-    "UN": "UNKNOWN",
-}
-"""Some of these states are only shown when using scontrol or squeue but these
-commands do not provide info for finished commands.
-
-sacct only returns these states https://slurm.schedmd.com/sacct.html#lbAG
-"""
-
-
-class ObjectValue(TypeDecorator):
+class JSONValue(TypeDecorator):
     """Store JSON-serializable objects in a SQLite3 database."""
 
     impl = String
+    cache_ok = True
 
     def process_bind_param(self, value, dialect):
         if value is not None:
-            if isinstance(value, (dict, list, tuple)):
-                value = json.dumps(value)
-            elif isinstance(value, Path):
-                value = str(value.absolute())
-            else:
+            if not isinstance(value, (dict, list, tuple)):
                 raise TypeError(
-                    f"ObjectValue must be a dict, list, tuple or Path but got {type(value)}"
+                    f"JSONValue must be a dict, list or tuple but got {type(value)}"
                 )
+            # compact separators keep long task id lists small
+            value = json.dumps(value, separators=(",", ":"))
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            value = json.loads(value)
+        return value
+
+
+class PathValue(TypeDecorator):
+    """Store absolute paths in a SQLite3 database."""
+
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None:
+            if not isinstance(value, Path):
+                raise TypeError(f"PathValue must be a Path but got {type(value)}")
+            value = str(value.absolute())
         return value
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            if value.startswith("/"):
-                value = Path(value)
-            else:
-                value = json.loads(value)
+            value = Path(value)
         return value
 
 
@@ -115,6 +110,8 @@ job_dependencies = Table(
     Base.metadata,
     Column("job_id", Integer, ForeignKey("jobs.id"), primary_key=True),
     Column("waited_for_job_id", Integer, ForeignKey("jobs.id"), primary_key=True),
+    # the primary key index only helps lookups by job_id
+    Index("ix_job_dependencies_waited_for_job_id", "waited_for_job_id"),
 )
 
 
@@ -139,16 +136,18 @@ class Job(Base):
 
     __tablename__ = "jobs"
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(30))
-    command: Mapped[list] = mapped_column(ObjectValue)
-    logs_dir: Mapped[Path] = mapped_column(ObjectValue)
+    name: Mapped[str] = mapped_column(String(30), index=True)
+    command: Mapped[list] = mapped_column(JSONValue)
+    logs_dir: Mapped[Path] = mapped_column(PathValue)
     is_array_job: Mapped[bool]
     dependencies_str: Mapped[Optional[str]] = mapped_column(String(2048))
     grid_id: Mapped[Optional[int]]
-    state: Mapped[Optional[str]] = mapped_column(String(30), default="UNKNOWN")
+    state: Mapped[Optional[str]] = mapped_column(
+        String(30), default="UNKNOWN", index=True
+    )
     exit_code: Mapped[Optional[str]]
     nodes: Mapped[Optional[str]]  # list of node names
-    array_task_ids: Mapped[Optional[list[int]]] = mapped_column(ObjectValue)
+    array_task_ids: Mapped[Optional[list[int]]] = mapped_column(JSONValue)
     dependencies_jobdependency: Mapped[list[JobDependency]] = relationship(
         JobDependency,
         primaryjoin=id == JobDependency.job_id,  # type: ignore[attr-defined]
@@ -183,7 +182,7 @@ class Job(Base):
             f")"
         )
 
-    @property
+    @functools.cached_property
     def output_options(self):
         # check if it is an array job
         if self.is_array_job:
@@ -201,17 +200,35 @@ class Job(Base):
         content += shlex.join(self.command[split_idx + 1 :]) + "\n"
         return content
 
-    def get_dependencies_jobs(self, session):
-        return (
-            session.query(Job)
-            .filter(Job.id.in_(job_ids_from_dep_str(self.dependencies_str)))
-            .all()
-        )
-
-    def submitted_command(self, fh, session):
+    @functools.cached_property
+    def command_str(self) -> str:
+        """The gridtk command that submits this job, quoted for the shell."""
+        return "gridtk submit " + shlex.join(self.command)
+
+    def get_dependencies_jobs(self, session, loaded_jobs=None):
+        """Return the jobs in the order they appear in the dependency string.
+
+        Jobs found in ``loaded_jobs`` (a mapping of job ids to jobs) or already
+        loaded in the session are not queried again.
+        """
+        job_ids = job_ids_from_dep_str(self.dependencies_str)
+        jobs_by_id = {}
+        for job_id in job_ids:
+            job = (loaded_jobs or {}).get(job_id)
+            if job is None:
+                job = session.identity_map.get(session.identity_key(Job, job_id))
+            if job is not None:
+                jobs_by_id[job_id] = job
+        missing_ids = [job_id for job_id in job_ids if job_id not in jobs_by_id]
+        if missing_ids:
+            for job in session.query(Job).filter(Job.id.in_(missing_ids)):
+                jobs_by_id[job.id] = job
+        return [jobs_by_id[job_id] for job_id in job_ids if job_id in jobs_by_id]
+
+    def submitted_command(self, fh, session, loaded_jobs=None):
         command = list(self.command)
         if self.dependencies_str:
-            dep_jobs = self.get_dependencies_jobs(session)
+            dep_jobs = self.get_dependencies_jobs(session, loaded_jobs)
             dep_option = replace_job_ids_in_dep_str(
                 self.dependencies_str, [job.grid_id for job in dep_jobs]
             )
@@ -223,10 +240,9 @@ class Job(Base):
                 raise RuntimeError("Cannot use --wrap and --- together.")
             split_idx = command.index("---")
             fh.write(self.command_in_bash)
+            fh.close()  # close now to flush the file
             command = command[:split_idx] + [fh.name]
 
-        fh.flush()
-        fh.close()  # close now to flush the file
         output, error = self.output_options
         return [
             "sbatch",
@@ -238,29 +254,48 @@ class Job(Base):
             str(error),
         ] + command
 
-    def submit(self, session: Session = None):
-        with tempfile.NamedTemporaryFile(mode="w+t", suffix=".sh", delete=False) as fh:
-            try:
-                command = self.submitted_command(fh=fh, session=session)
-                output = subprocess.check_output(
-                    command,
-                    text=True,
-                )
-            finally:
-                # remove the temporary file here because we don't want it
-                # deleted after fh.close() is called
-                Path(fh.name).unlink(missing_ok=True)
+    def submit(self, session: Session = None, loaded_jobs=None):
+        # a temporary script is only needed for commands given after ---
+        if not self.command_in_bash:
+            command = self.submitted_command(
+                fh=None, session=session, loaded_jobs=loaded_jobs
+            )
+            output = subprocess.check_output(command, text=True)
+        else:
+            with tempfile.NamedTemporaryFile(
+                mode="w+t", suffix=".sh", delete=False
+            ) as fh:
+                try:
+                    command = self.submitted_command(
+                        fh=fh, session=session, loaded_jobs=loaded_jobs
+                    )
+                    output = subprocess.check_output(
+                        command,
+                        text=True,
+                    )
+                finally:
+                    # remove the temporary file here because we don't want it
+                    # deleted after fh.close() is called
+                    Path(fh.name).unlink(missing_ok=True)
         # find job ID from output
         # output is like b'Submitted batch job 123456789\n'
-        self.grid_id = int(re.search("[0-9]+", output).group())
+        self.grid_id = int(GRID_ID_PATTERN.search(output).group())
+        # a resubmitted job starts over and must be polled again
+        self.state = "UNKNOWN"
+        self.__dict__.pop("output_files", None)
         return self.grid_id
 
     def cancel(self, delete_logs: bool = False):
-        subprocess.check_output(["scancel"] + [str(self.grid_id)])
+        """Cancel this job only; the job manager cancels several at once."""
+        if self.grid_id:
+            subprocess.check_output(["scancel", str(self.grid_id)])
         if delete_logs:
-            for path in self.output_files + self.error_files:
-                if path.exists():
-                    path.unlink()
+            self.delete_logs()
+
+    def delete_logs(self):
+        # error files are currently the same as the output files
+        for path in dict.fromkeys(self.output_files + self.error_files):
+            path.unlink(missing_ok=True)
 
     def update(self, job_status_dict: dict):
         if not job_status_dict:
@@ -273,25 +308,35 @@ class Job(Base):
             # TODO: sometimes only the state_reason from squeue contains the reason
             self.nodes = job_status_dict["state"]["reason"]
         assert (
-            self.state in JOB_STATES_MAPPING.values()
+            self.state in JOB_STATES
         ), f"Unknown job state {self.state}, read from {job_status_dict}"
         return
 
-    @property
-    def output_files(self):
+    def iter_output_files(self, array_task_ids=None):
+        """Yield the output files of the job, one per array task.
+
+        ``array_task_ids`` restricts the output files to those array tasks.
+        """
         output, _ = map(str, self.output_options)
         if not self.is_array_job:
-            return [Path(output.replace("%j", str(self.grid_id)))]
-        files = []
-        for array_task_id in self.array_task_ids:
-            files.append(
-                output.replace("%A", str(self.grid_id)).replace(
-                    "%a", str(array_task_id)
-                )
-            )
-        return list(map(Path, files))
+            yield Path(output.replace("%j", str(self.grid_id)))
+            return
+        # split the template once instead of searching it for each task
+        output_parts = output.replace("%A", str(self.grid_id)).split("%a")
+        if array_task_ids is None:
+            array_task_ids = self.array_task_ids
+        for array_task_id in array_task_ids:
+            yield Path(str(array_task_id).join(output_parts))
+
+    @functools.cached_property
+    def output_files(self):
+        # the cache is cleared in submit() when the job gets a new grid id
+        return list(self.iter_output_files())
 
     @property
     def error_files(self):
         # as of now error files are the same as output files but this could change.
         return self.output_files
+
+    def iter_error_files(self, array_task_ids=None):
+        return self.iter_output_files(array_task_ids)
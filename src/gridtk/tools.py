@@ -7,6 +7,62 @@ import re
 
 from typing import Optional
 
+JOB_STATES_MAPPING = {
+    "BF": "BOOT_FAIL",
+    "CA": "CANCELLED",
+    "CD": "COMPLETED",
+    "CF": "CONFIGURING",
+    "CG": "COMPLETING",
+    "DL": "DEADLINE",
+    "F": "FAILED",
+    "NF": "NODE_FAIL",
+    "OOM": "OUT_OF_MEMORY",
+    "PD": "PENDING",
+    "PR": "PREEMPTED",
+    "RD": "RESV_DEL_HOLD",
+    "RF": "REQUEUE_FED",
+    "RH": "REQUEUE_HOLD",
+    "RQ": "REQUEUED",
+    "R": "RUNNING",
+    "RS": "RESIZING",
+    "RV": "REVOKED",
+    "SE": "SPECIAL_EXIT",
+    "SI": "SIGNALING",
+    "SO": "STAGE_OUT",
+    "S": "SUSPENDED",
+    "ST": "STOPPED",
+    "TO": "TIMEOUT",
+    "UN": "UNKNOWN",
+}
+"""Some of these states are only shown when using scontrol or squeue but these
+commands do not provide info for finished commands.
+
+sacct only returns these states https://slurm.schedmd.com/sacct.html#lbAG
+"""
+
+JOB_STATES = frozenset(JOB_STATES_MAPPING.values())
+"""The long names of all job states, for fast membership tests."""
+
+JOB_FINAL_STATES = frozenset(
+    (
+        "CANCELLED",
+        "COMPLETED",
+        "DEADLINE",
+        "FAILED",
+        "OUT_OF_MEMORY",
+        "TIMEOUT",
+    )
+)
+"""States after which a job does not change anymore unless it is resubmitted.
+
+BOOT_FAIL, NODE_FAIL and PREEMPTED are left out because Slurm requeues such
+jobs by itself when they were submitted with ``--requeue``. Jobs requeued by
+hand with ``scontrol requeue`` need a refresh, see ``gridtk list --refresh``.
+"""
+
+# Regular expression to match job IDs with optional +time
+JOB_ID_PATTERN = re.compile(r"(\d+)(\+\d+)?")
+
 
 def parse_array_indexes(indexes_str: str) -> list[int]:
     """Pares a string of array indexes to a list of integers."""
@@ -16,16 +72,16 @@ def parse_array_indexes(indexes_str: str) -> list[int]:
             range_part, step = range_str.split(":")
             start, end = map(int, range_part.split("-"))
             step = int(step)
-            return list(range(start, end + 1, step))
+            return range(start, end + 1, step)
 
         start, end = map(int, range_str.split("-"))
-        return list(range(start, end + 1))
+        return range(start, end + 1)
 
     def parse_segment(segment):
         if "-" in segment:
             return parse_range(segment)
 
-        return [int(segment)]
+        return (int(segment),)
 
     # Remove any limit on simultaneous running tasks
     if "%" in indexes_str:
@@ -43,29 +99,26 @@ def job_ids_from_dep_str(dependency_string: Optional[str]) -> list[int]:
     """Extract job IDs from a dependency string."""
     if not dependency_string:
         return []
-    # Regular expression to match job IDs with optional +time
-    dep_job_id_pattern = re.compile(r"(\d+)(?:\+\d+)?")
-
     # Find all matches in the dependency string
-    job_ids = dep_job_id_pattern.findall(dependency_string)
+    return [int(match.group(1)) for match in JOB_ID_PATTERN.finditer(dependency_string)]
+
 
-    return list(map(int, job_ids))
+_MISSING = object()
 
 
 def replace_job_ids_in_dep_str(dependency_string, replacements):
     """Replace job IDs in a dependency string with new IDs from a list."""
     if not dependency_string:
         return dependency_string
-    # Regular expression to match job IDs with optional +time
-    job_id_pattern = re.compile(r"(\d+)(\+\d+)?")
+    replacements_iter = iter(replacements)
 
     # Function to replace matched job ID with corresponding replacement from the list
     def replacement_func(match):
         time_part = match.group(2) if match.group(2) else ""
-        if replacements:
-            new_job_id = replacements.pop(0)
-            return f"{new_job_id}{time_part}"
-        raise ValueError("Not enough replacements")
+        new_job_id = next(replacements_iter, _MISSING)
+        if new_job_id is _MISSING:
+            raise ValueError("Not enough replacements")
+        return f"{new_job_id}{time_part}"
 
     # Substitute all job IDs in the dependency string
-    return job_id_pattern.sub(replacement_func, dependency_string)
+    return JOB_ID_PATTERN.sub(replacement_func, dependency_string)
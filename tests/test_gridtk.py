@@ -4,16 +4,30 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import json
+import os
 import stat
+import tempfile
 import traceback
 
 from pathlib import Path
 from unittest.mock import Mock, patch
 
+import click
 import pytest
 
 from click.testing import CliRunner
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
 from gridtk.__main__ import cli
+from gridtk.cli import parse_job_ids
+from gridtk.manager import (
+    SACCT_MAX_JOB_IDS,
+    JobManager,
+    cancel_jobs,
+    update_job_statuses,
+)
+from gridtk.models import Job
 from gridtk.tools import (
     job_ids_from_dep_str,
     parse_array_indexes,
@@ -66,50 +80,68 @@ def _failed_job_sacct_json(job_id):
     return json.dumps(_jobs_sacct_dict([job_id], "FAILED", "None", "node001"))
 
 
-def test_parse_array_indexes():
-    # Simple range
-    assert parse_array_indexes("0-15") == list(range(0, 16))
-
-    # Multiple values (combination of single indexes and ranges)
-    assert parse_array_indexes("0,6,16-32") == [0, 6] + list(range(16, 33))
-
-    # Step function within a range
-    assert parse_array_indexes("0-15:4") == [0, 4, 8, 12]
-
-    # Maximum number of simultaneously running tasks (should ignore %)
-    assert parse_array_indexes("0-15%4") == list(range(0, 16))
-
-    # Combination of ranges and steps
-    assert parse_array_indexes("0-4,10-20:5") == [0, 1, 2, 3, 4, 10, 15, 20]
-
-    # Complex case with range, steps, and multiple values
-    assert parse_array_indexes("0,2-6:2,10-12") == [0, 2, 4, 6, 10, 11, 12]
-
-    # Minimum index value is 0
-    assert parse_array_indexes("0,1,2-4") == [0, 1, 2, 3, 4]
-
-    # Maximum index value one less than MaxArraySize (assuming MaxArraySize is 50)
-    assert parse_array_indexes("45-49") == [45, 46, 47, 48, 49]
+@pytest.mark.parametrize(
+    "indexes, expected",
+    [
+        # Simple range
+        ("0-15", list(range(0, 16))),
+        # Multiple values (combination of single indexes and ranges)
+        ("0,6,16-32", [0, 6] + list(range(16, 33))),
+        # Step function within a range
+        ("0-15:4", [0, 4, 8, 12]),
+        # Maximum number of simultaneously running tasks (should ignore %)
+        ("0-15%4", list(range(0, 16))),
+        # Combination of ranges and steps
+        ("0-4,10-20:5", [0, 1, 2, 3, 4, 10, 15, 20]),
+        # Complex case with range, steps, and multiple values
+        ("0,2-6:2,10-12", [0, 2, 4, 6, 10, 11, 12]),
+        # Minimum index value is 0
+        ("0,1,2-4", [0, 1, 2, 3, 4]),
+        # Maximum index value one less than MaxArraySize (assuming MaxArraySize is 50)
+        ("45-49", [45, 46, 47, 48, 49]),
+        # Mixed single indexes, ranges, and steps with %
+        ("0,2-8:2,10-14%3", [0, 2, 4, 6, 8, 10, 11, 12, 13, 14]),
+    ],
+)
+def test_parse_array_indexes(indexes, expected):
+    assert parse_array_indexes(indexes) == expected
+
+
+@pytest.mark.parametrize(
+    "indexes",
+    [
+        # Empty string
+        "",
+        # Invalid step
+        "1-5:a",
+        # Non-integer segment
+        "1,2,three",
+    ],
+)
+def test_parse_array_indexes_invalid(indexes):
+    with pytest.raises(ValueError):
+        parse_array_indexes(indexes)
 
-    # Mixed single indexes, ranges, and steps with %
-    assert parse_array_indexes("0,2-8:2,10-14%3") == [0, 2, 4, 6, 8, 10, 11, 12, 13, 14]
 
-    # Empty string should raise a ValueError
-    with pytest.raises(ValueError):
-        parse_array_indexes("")
+def test_parse_job_ids():
+    assert parse_job_ids(None) == []
+    assert parse_job_ids("") == []
+    assert parse_job_ids("3") == [3]
+    assert parse_job_ids("3,5") == [3, 5]
+    assert parse_job_ids("3-5") == [3, 4, 5]
+    assert parse_job_ids("4+3") == [4, 5, 6, 7]
+    assert parse_job_ids("1,3-5,8+1") == [1, 3, 4, 5, 8, 9]
 
-    # Handling invalid step (should raise ValueError)
-    with pytest.raises(ValueError):
-        parse_array_indexes("1-5:a")
+    with pytest.raises(click.BadParameter):
+        parse_job_ids("1,two")
 
-    # Non-integer segment (should raise ValueError)
-    with pytest.raises(ValueError):
-        parse_array_indexes("1,2,three")
+    with pytest.raises(click.BadParameter):
+        parse_job_ids("1-2-3")
 
 
-def test_extract_job_ids_from_dep_str():
-    """Test extract job ids from dependency string."""
-    for dep_str, expected_result, expected_replaced in [
+@pytest.mark.parametrize(
+    "dep_str, expected_result, expected_replaced",
+    [
         (None, [], None),
         ("", [], ""),
         ("20", [20], "1020"),
@@ -130,27 +162,43 @@ def test_extract_job_ids_from_dep_str():
             [20, 21, 23],
             "after:1020+15:1021+30?afterany:1023",
         ),
-    ]:
-        result = job_ids_from_dep_str(dep_str)
-        assert result == expected_result
-        replaced_deps = replace_job_ids_in_dep_str(dep_str, [v + 1000 for v in result])
-        assert replaced_deps == expected_replaced
+    ],
+)
+def test_extract_job_ids_from_dep_str(dep_str, expected_result, expected_replaced):
+    """Test extract job ids from dependency string."""
+    result = job_ids_from_dep_str(dep_str)
+    assert result == expected_result
+    replaced_deps = replace_job_ids_in_dep_str(dep_str, [v + 1000 for v in result])
+    assert replaced_deps == expected_replaced
 
 
-def assert_click_runner_result(result, exit_code=0, exception_type=None):
-    """Helper for asserting click runner results."""
+def test_replace_job_ids_in_dep_str_not_enough_replacements():
+    with pytest.raises(ValueError):
+        replace_job_ids_in_dep_str("afterok:20:21", [1020])
+    # a None replacement is not mistaken for running out of replacements
+    assert replace_job_ids_in_dep_str("20", [None]) == "None"
+
+
+def _click_runner_result_message(result):
     m = "Click command exited with code `{}' and exception:\n{}" "\nThe output was:\n{}"
     exception = (
         "None"
         if result.exc_info is None
         else "".join(traceback.format_exception(*result.exc_info))
     )
-    m = m.format(result.exit_code, exception, result.output)
-    assert result.exit_code == exit_code, m
+    return m.format(result.exit_code, exception, result.output)
+
+
+def assert_click_runner_result(result, exit_code=0, exception_type=None):
+    """Helper for asserting click runner results."""
+    # the message is only formatted when an assertion fails
+    assert result.exit_code == exit_code, _click_runner_result_message(result)
     if exit_code == 0:
-        assert not result.exception, m
+        assert not result.exception, _click_runner_result_message(result)
     if exception_type is not None:
-        assert isinstance(result.exception, exception_type), m
+        assert isinstance(result.exception, exception_type), (
+            _click_runner_result_message(result)
+        )
 
 
 @patch("subprocess.check_output")
@@ -242,6 +290,123 @@ def test_list_jobs(mock_check_output, runner):
         )
 
 
+@patch("subprocess.check_output")
+def test_list_jobs_updates_selected_jobs_only(mock_check_output, runner):
+    with runner.isolated_filesystem():
+        for submit_job_id in (9876543, 9876544):
+            _submit_job(
+                runner=runner, mock_check_output=mock_check_output, job_id=submit_job_id
+            )
+
+        mock_check_output.reset_mock()
+        mock_check_output.return_value = _pending_job_sacct_json(9876544)
+        result = runner.invoke(cli, ["list", "--jobs", "2"])
+        assert_click_runner_result(result)
+        assert "9876544" in result.output
+        assert "9876543" not in result.output
+        mock_check_output.assert_called_once_with(
+            ["sacct", "-j", "9876544", "--json"], text=True
+        )
+
+
+@patch("subprocess.check_output")
+def test_update_jobs_once_per_session(mock_check_output, runner):
+    with runner.isolated_filesystem():
+        submit_job_id = 9876543
+        _submit_job(
+            runner=runner, mock_check_output=mock_check_output, job_id=submit_job_id
+        )
+
+        mock_check_output.reset_mock()
+        mock_check_output.return_value = _pending_job_sacct_json(submit_job_id)
+        job_manager = JobManager(database=Path("jobs.sql3"), logs_dir=Path("logs"))
+        with job_manager:
+            job_manager.list_jobs()
+            jobs = job_manager.list_jobs()
+        assert jobs[0].state == "PENDING"
+        mock_check_output.assert_called_once_with(
+            ["sacct", "-j", str(submit_job_id), "--json"], text=True
+        )
+
+
+@patch("subprocess.check_output")
+def test_update_jobs_skips_finished_jobs(mock_check_output, runner):
+    with runner.isolated_filesystem():
+        submit_job_id = 9876543
+        _submit_job(
+            runner=runner, mock_check_output=mock_check_output, job_id=submit_job_id
+        )
+
+        mock_check_output.return_value = _failed_job_sacct_json(submit_job_id)
+        result = runner.invoke(cli, ["list"])
+        assert_click_runner_result(result)
+
+        mock_check_output.reset_mock()
+        job_manager = JobManager(database=Path("jobs.sql3"), logs_dir=Path("logs"))
+        with job_manager:
+            jobs = job_manager.list_jobs()
+        assert jobs[0].state == "FAILED"
+        mock_check_output.assert_not_called()
+
+        # finished jobs can be requeued by hand, which --refresh picks up
+        mock_check_output.return_value = _pending_job_sacct_json(submit_job_id)
+        result = runner.invoke(cli, ["list", "--refresh"])
+        assert_click_runner_result(result)
+        assert "PENDING" in result.output
+        mock_check_output.assert_called_once_with(
+            ["sacct", "-j", str(submit_job_id), "--json"], text=True
+        )
+
+
+def test_job_manager_checks_schema_once(tmp_path):
+    job_manager = JobManager(
+        database=tmp_path / "jobs.sql3", logs_dir=tmp_path / "logs"
+    )
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record_statement)
+    try:
+        with job_manager:
+            pass
+        assert any(statement.startswith("PRAGMA") for statement in statements)
+        statements.clear()
+        with job_manager:
+            pass
+    finally:
+        event.remove(Engine, "before_cursor_execute", record_statement)
+    assert statements == []
+
+
+@patch("subprocess.check_output")
+def test_update_job_statuses_in_chunks(mock_check_output):
+    grid_ids = list(range(1, SACCT_MAX_JOB_IDS + 2))
+    mock_check_output.side_effect = [
+        json.dumps(_jobs_sacct_dict(grid_ids[:-1], "RUNNING", "None", "node001")),
+        json.dumps(_jobs_sacct_dict(grid_ids[-1:], "PENDING", "None", "node001")),
+    ]
+    status = update_job_statuses(grid_ids)
+    assert sorted(status) == grid_ids
+    assert status[grid_ids[-1]]["state"]["current"] == ["PENDING"]
+    mock_check_output.assert_called_with(
+        ["sacct", "-j", str(grid_ids[-1]), "--json"], text=True
+    )
+
+
+def _file_modes_are_enforced():
+    # root and some file systems ignore read-only file modes
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "probe"
+        path.touch()
+        path.chmod(stat.S_IREAD)
+        return not os.access(path, os.W_OK)
+
+
+@pytest.mark.skipif(
+    not _file_modes_are_enforced(), reason="read-only file modes are not enforced"
+)
 @patch("subprocess.check_output")
 def test_list_jobs_readonly_database(mock_check_output, runner):
     with runner.isolated_filesystem():
@@ -275,11 +440,48 @@ def test_report_job(mock_check_output, runner):
             "Job ID: 1\nName: gridtk\nState: PENDING (0)\nNodes: Unassigned\nSubmitted command: ['sbatch', '--job-name', 'gridtk'"
         )
         assert "Output file: /tmp/" in result.output
+        # the report ends with a single newline, as it did with pydoc.pager
+        assert result.output.endswith(f"/logs/gridtk.{submit_job_id}.out\n")
         mock_check_output.assert_called_with(
             ["sacct", "-j", str(submit_job_id), "--json"], text=True
         )
 
 
+@patch("subprocess.check_output")
+def test_report_array_job_task(mock_check_output, runner):
+    with runner.isolated_filesystem():
+        submit_job_id = 9876543
+        mock_check_output.return_value = _sbatch_output(submit_job_id)
+        result = runner.invoke(cli, ["submit", "--array", "1-3", "--wrap=sleep"])
+        assert_click_runner_result(result)
+
+        Path(f"logs/gridtk.{submit_job_id}-2.out").write_text("task 2 output")
+        mock_check_output.return_value = _pending_job_sacct_json(submit_job_id)
+        result = runner.invoke(cli, ["report", "--array", "2"])
+        assert_click_runner_result(result)
+        assert result.output.count("Output file: ") == 1
+        assert f"gridtk.{submit_job_id}-2.out\ntask 2 output" in result.output
+
+
+@patch("subprocess.check_output")
+def test_job_cancel(mock_check_output):
+    Job(grid_id=9876543).cancel()
+    mock_check_output.assert_called_once_with(["scancel", "9876543"])
+    # jobs that were never submitted have nothing to cancel
+    mock_check_output.reset_mock()
+    Job(grid_id=None).cancel()
+    mock_check_output.assert_not_called()
+
+
+@patch("subprocess.check_output")
+def test_cancel_jobs_skips_jobs_without_grid_id(mock_check_output):
+    cancel_jobs([Job(grid_id=9876543), Job(grid_id=None), Job(grid_id=9876544)])
+    mock_check_output.assert_called_once_with(["scancel", "9876543", "9876544"])
+    mock_check_output.reset_mock()
+    cancel_jobs([Job(grid_id=None)])
+    mock_check_output.assert_not_called()
+
+
 @patch("subprocess.check_output")
 def test_stop_jobs(mock_check_output, runner):
     with runner.isolated_filesystem():
@@ -303,11 +505,13 @@ def test_delete_jobs(mock_check_output, runner):
             runner=runner, mock_check_output=mock_check_output, job_id=submit_job_id
         )
 
-        mock_check_output.return_value = _pending_job_sacct_json(submit_job_id)
+        # without a state filter, delete does not poll sacct
+        mock_check_output.reset_mock()
+        mock_check_output.return_value = ""
         result = runner.invoke(cli, ["delete"])
         assert_click_runner_result(result)
         assert result.output == f"Deleted job 1 with slurm id {submit_job_id}\n"
-        mock_check_output.assert_called_with(["scancel", str(submit_job_id)])
+        mock_check_output.assert_called_once_with(["scancel", str(submit_job_id)])
 
         # test if state filtering works
         submit_job_id_1 = 9876544
@@ -330,6 +534,7 @@ def test_delete_jobs(mock_check_output, runner):
                 0
             ],
         ]
+        mock_check_output.reset_mock()
         mock_check_output.side_effect = [
             json.dumps({"jobs": jobs}),
             "",  # for scancel
@@ -337,6 +542,11 @@ def test_delete_jobs(mock_check_output, runner):
         result = runner.invoke(cli, ["delete", "-s", "CD"])
         assert_click_runner_result(result)
         assert result.output == f"Deleted job 1 with slurm id {submit_job_id_1}\n"
+        # the state filter needs exactly one sacct call before scancel
+        assert [call.args[0][0] for call in mock_check_output.call_args_list] == [
+            "sacct",
+            "scancel",
+        ]
         mock_check_output.assert_called_with(["scancel", str(submit_job_id_1)])
 
 
@@ -375,6 +585,42 @@ def test_resubmit_jobs(mock_check_output, runner):
         )
 
 
+@patch("subprocess.check_output")
+def test_resubmit_jobs_loads_dependencies_once(mock_check_output, runner):
+    with runner.isolated_filesystem():
+        _submit_job(runner=runner, mock_check_output=mock_check_output, job_id=1111)
+        mock_check_output.return_value = _sbatch_output(1112)
+        result = runner.invoke(cli, ["submit", "--dependency", "1", "--wrap=sleep"])
+        assert_click_runner_result(result)
+
+        selects = []
+
+        def record_select(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().startswith("SELECT"):
+                selects.append((statement, parameters))
+
+        mock_check_output.side_effect = [
+            _failed_job_sacct_json(1112),  # sacct
+            "",  # scancel
+            _sbatch_output(1113),  # sbatch
+        ]
+        event.listen(Engine, "before_cursor_execute", record_select)
+        try:
+            result = runner.invoke(cli, ["resubmit", "--jobs", "2"])
+        finally:
+            event.remove(Engine, "before_cursor_execute", record_select)
+        assert_click_runner_result(result)
+        assert mock_check_output.call_args.args[0][7:9] == ["--dependency", "1111"]
+        # the job that is depended on is selected only once
+        dependency_selects = [
+            select
+            for select in selects
+            if select[0].rstrip().endswith("IN (?)") and select[1] == (1,)
+        ]
+        assert len(dependency_selects) == 1
+        assert len(selects) == len(set(selects))
+
+
 @patch("subprocess.check_output")
 def test_submit_with_dependencies(mock_check_output, runner):
     with runner.isolated_filesystem() as tmpdir:
@@ -403,17 +649,41 @@ def test_submit_with_dependencies(mock_check_output, runner):
             text=True,
         )
 
+        # dependencies are replaced by grid ids in the order they are given
+        third_grid_id = 1113
+        mock_check_output.return_value = _sbatch_output(third_grid_id)
+        result = runner.invoke(
+            cli, ["submit", "--dependency", "afterok:2:1,afterany:2", "script.sh"]
+        )
+        assert_click_runner_result(result)
+        assert mock_check_output.call_args.args[0][7:9] == [
+            "--dependency",
+            f"afterok:{second_grid_id}:{first_grid_id},afterany:{second_grid_id}",
+        ]
+        result = runner.invoke(cli, ["delete", "--jobs", "3"])
+        assert_click_runner_result(result)
+
         # test if dependent jobs get resubmitted too
         mock_check_output.side_effect = [
-            _failed_job_sacct_json(first_grid_id),  # sacct
+            json.dumps(
+                _jobs_sacct_dict(
+                    [first_grid_id, second_grid_id], "FAILED", "None", "node001"
+                )
+            ),  # sacct
             "",  # scancel
             _sbatch_output(first_grid_id + 10),  # sbatch
-            "",  # scancel
             _sbatch_output(second_grid_id + 10),  # sbatch
         ]
         result = runner.invoke(cli, ["resubmit", "--jobs", "1", "--dependents"])
         assert_click_runner_result(result)
         assert result.output == "Resubmitted job 1\nResubmitted job 2\n"
+        # the statuses of both jobs are polled with a single sacct call
+        assert mock_check_output.call_args_list[-4].args[0] == [
+            "sacct",
+            "-j",
+            f"{first_grid_id},{second_grid_id}",
+            "--json",
+        ]
         mock_check_output.assert_called_with(
             [
                 "sbatch",
@@ -431,9 +701,8 @@ def test_submit_with_dependencies(mock_check_output, runner):
         )
 
         # test if dependent jobs get deleted too
+        mock_check_output.reset_mock()
         mock_check_output.side_effect = [
-            _failed_job_sacct_json(first_grid_id + 10),  # sacct
-            "",  # scancel
             "",  # scancel
         ]
         result = runner.invoke(cli, ["delete", "--jobs", "1", "--dependents"])
@@ -442,7 +711,9 @@ def test_submit_with_dependencies(mock_check_output, runner):
             result.output
             == f"Deleted job 1 with slurm id {first_grid_id + 10}\nDeleted job 2 with slurm id {second_grid_id + 10}\n"
         )
-        mock_check_output.assert_called_with(["scancel", str(second_grid_id + 10)])
+        mock_check_output.assert_called_once_with(
+            ["scancel", str(first_grid_id + 10), str(second_grid_id + 10)]
+        )
 
         # what happens if you depend on job that doesn't exist?
         mock_check_output.return_value = _sbatch_output(second_grid_id)
@@ -499,13 +770,9 @@ def test_submit_with_dependencies(mock_check_output, runner):
         )
 
         # now delete all the jobs
+        mock_check_output.reset_mock()
         mock_check_output.side_effect = [
-            _failed_job_sacct_json(first_grid_id),  # sacct
-            "",  # scancel 1
-            "",  # scancel 2
-            "",  # scancel 3
-            "",  # scancel 4
-            "",  # scancel 5
+            "",  # scancel
         ]
         result = runner.invoke(cli, ["delete", "--dependents"])
         assert_click_runner_result(result)
@@ -518,6 +785,16 @@ Deleted job 4 with slurm id {second_grid_id + 10}
 Deleted job 5 with slurm id {third_grid_id + 10}
 """
         )
+        mock_check_output.assert_called_once_with(
+            [
+                "scancel",
+                str(first_grid_id),
+                str(second_grid_id),
+                str(first_grid_id + 10),
+                str(second_grid_id + 10),
+                str(third_grid_id + 10),
+            ]
+        )
 
 
 if __name__ == "__main__":